@@ -1,8 +1,12 @@
 from cog import BasePredictor, Input, Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import subprocess
+import hashlib
+import json
 import os
 import shutil
+import tempfile
 import zipfile
 
 VIDEO_FILE_EXTENSIONS = [
@@ -66,6 +70,7 @@ VIDEO_TASKS = [
     "trim_to_length",
     "trim_to_audio",
     "speed_to_fit",
+    "render_bundle",
 ]
 
 IMAGE_TASKS = [
@@ -75,6 +80,19 @@ IMAGE_TASKS = [
 
 ZIP_TASKS = ["zipped_frames_to_mp4", "zipped_frames_to_gif"]
 
+BUNDLE_RENDITIONS = ["mp4", "gif", "vertical", "thumbnail"]
+
+MAX_SEEK_FRAMES = 100  # Each seek-sampled frame is its own ffmpeg process
+
+# Scene indexes live outside /tmp/outputs so they survive between predictions
+SCENE_INDEX_DIR = "/tmp/scene_index"
+SCENE_PROXY_FPS = 5  # Frames per second analysed for scene changes
+SCENE_PROXY_WIDTH = 160  # Width of the downscaled analysis proxy
+SCENE_THRESHOLD = 0.3  # Scene score above which a frame starts a new shot
+SCENE_INDEX_VERSION = 2  # Bump when the proxy filter or index format changes
+SCENE_INDEX_MAX_FILES = 1000  # Least recently used indexes beyond this are deleted
+SCENE_MIN_TRIM_FRACTION = 0.5  # Ignore shot boundaries earlier than this fraction of duration
+
 
 class Predictor(BasePredictor):
     def validate_inputs(self, task: str, input_file: Path, audio_file: Path = None):
@@ -128,6 +146,7 @@ class Predictor(BasePredictor):
                 "trim_to_length",
                 "trim_to_audio",
                 "speed_to_fit",
+                "render_bundle",
             ],
         ),
         input_file: Path = Input(description="File – zip, image or video to process"),
@@ -144,6 +163,31 @@ class Predictor(BasePredictor):
             description="Background music volume relative to original audio (0.1 = quiet, 1.0 = same level, 2.0 = louder)",
             default=0.3,
         ),
+        renditions: str = Input(
+            description="Comma-separated outputs for render_bundle, rendered from a single decode: "
+            + ", ".join(BUNDLE_RENDITIONS),
+            default="mp4,gif,vertical,thumbnail",
+        ),
+        extract_mode: str = Input(
+            description="How extract_frames_from_input picks frames: every frame (resampled by fps), keyframes only, or num_frames evenly spaced seeks. keyframes relies on the decoder honouring -skip_frame nokey, otherwise every frame is still decoded. fps only applies to all, and only all can be combined with scene_aware",
+            choices=["all", "keyframes", "seek"],
+            default="all",
+        ),
+        num_frames: int = Input(
+            description="Number of evenly spaced frames for extract_mode=seek",
+            default=10,
+            ge=1,
+            le=MAX_SEEK_FRAMES,
+        ),
+        fit_mode: str = Input(
+            description="How make_vertical fits the frame into 9:16: crop the sides, pad with a blurred copy, or pad with black",
+            choices=["crop", "blur_pad", "color_pad"],
+            default="crop",
+        ),
+        scene_aware: bool = Input(
+            description="Snap trim_to_length to the last shot boundary before duration when the clip is longer than duration, and make extract_frames_from_input take one frame per shot",
+            default=False,
+        ),
     ) -> List[Path]:
         """Run prediction"""
         if os.path.exists("/tmp/outputs"):
@@ -154,6 +198,11 @@ class Predictor(BasePredictor):
         self.fps = fps
         self.duration = duration
         self.volume_ratio = volume_ratio
+        self.renditions = renditions
+        self.extract_mode = extract_mode
+        self.num_frames = num_frames
+        self.fit_mode = fit_mode
+        self.scene_aware = scene_aware
 
         if task == "convert_input_to_mp4":
             return self.convert_video_to(input_file, "mp4")
@@ -185,6 +234,8 @@ class Predictor(BasePredictor):
             return self.trim_to_audio(input_file, audio_file)
         elif task == "speed_to_fit":
             return self.speed_to_fit(input_file, audio_file)
+        elif task == "render_bundle":
+            return self.render_bundle(input_file)
 
         return []
 
@@ -204,6 +255,110 @@ class Predictor(BasePredictor):
         """Get audio duration in seconds using ffprobe"""
         return self.get_video_duration(audio_path)  # Same command works for audio
 
+    def file_hash(self, path: Path) -> str:
+        """SHA-256 of the file contents"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_scene_scores(self, input_args: List[str], filters: str) -> List[List[float]]:
+        """Run a scene score pass and return [pts_time, score] for every frame"""
+        fd, scores_path = tempfile.mkstemp(dir=SCENE_INDEX_DIR, suffix=".scores")
+        os.close(fd)
+        try:
+            command = input_args + [
+                "-an",
+                "-vf",
+                f"{filters},select='gte(scene,0)',metadata=print:file={scores_path}",
+                "-f", "null",
+            ]
+            self.run_ffmpeg(None, "-", command)
+
+            scores = []
+            pts_time = None
+            with open(scores_path) as f:
+                for line in f:
+                    if line.startswith("frame:"):
+                        pts_time = float(line.split("pts_time:")[1].split()[0])
+                    elif line.startswith("lavfi.scene_score=") and pts_time is not None:
+                        scores.append([pts_time, float(line.split("=")[1])])
+            return scores
+        finally:
+            os.remove(scores_path)
+
+    def get_scene_index(self, video_path: Path) -> dict:
+        """Scene scores of a low-resolution proxy, cached by content hash"""
+        os.makedirs(SCENE_INDEX_DIR, exist_ok=True)
+        # Analysis settings are part of the key so changing them never serves a stale index
+        cache_key = "{}-v{}-{}fps-{}w".format(
+            self.file_hash(video_path), SCENE_INDEX_VERSION, SCENE_PROXY_FPS, SCENE_PROXY_WIDTH
+        )
+        index_path = f"{SCENE_INDEX_DIR}/{cache_key}.json"
+        if os.path.exists(index_path):
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+                os.utime(index_path)  # Mark as recently used for pruning
+                print("Using cached scene index " + index_path)
+                return index
+            except (OSError, ValueError):
+                print("Ignoring unreadable scene index " + index_path)
+
+        # Analyse a decimated, downscaled proxy, skipping non-reference frames at the decoder
+        scores = self.get_scene_scores(
+            ["-skip_frame", "noref", "-i", str(video_path)],
+            f"fps={SCENE_PROXY_FPS},scale={SCENE_PROXY_WIDTH}:-2",
+        )
+
+        index = {"scores": scores}
+        # Write then rename, so a killed run never leaves a truncated index behind
+        fd, tmp_path = tempfile.mkstemp(dir=SCENE_INDEX_DIR, suffix=".json.tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.prune_scene_index()
+        return index
+
+    def prune_scene_index(self):
+        """Delete the least recently used indexes beyond SCENE_INDEX_MAX_FILES"""
+        index_paths = [
+            f"{SCENE_INDEX_DIR}/{filename}"
+            for filename in os.listdir(SCENE_INDEX_DIR)
+            if filename.endswith(".json")
+        ]
+        index_paths.sort(key=os.path.getmtime)
+        for index_path in index_paths[:-SCENE_INDEX_MAX_FILES]:
+            try:
+                os.remove(index_path)
+            except FileNotFoundError:
+                pass
+
+    def get_scene_boundaries(self, video_path: Path) -> List[float]:
+        """Start times of every shot after the first"""
+        index = self.get_scene_index(video_path)
+        return [t for t, score in index["scores"] if score > SCENE_THRESHOLD and t > 0]
+
+    def get_cut_end(self, video_path: Path, boundary: float) -> float:
+        """Time to stop at so a trim ends on the last frame before a proxy boundary's cut"""
+        # The proxy boundary can be up to a proxy frame (or more, with skipped frames) after the cut,
+        # so rescan a short window around it at full frame rate
+        start = max(0.0, boundary - 2 / SCENE_PROXY_FPS)
+        scores = self.get_scene_scores(
+            ["-ss", str(start), "-t", str(3 / SCENE_PROXY_FPS), "-i", str(video_path)],
+            f"scale={SCENE_PROXY_WIDTH}:-2",
+        )
+        cut = max(range(len(scores)), key=lambda i: scores[i][1], default=None)
+        if not cut or scores[cut][1] <= SCENE_THRESHOLD:
+            return boundary - 1 / SCENE_PROXY_FPS
+        # Halfway between the last old frame and the first new one, clear of rounding either way
+        return start + (scores[cut - 1][0] + scores[cut][0]) / 2
+
     def unzip(self, input_path: Path) -> List[Path]:
         """Unzip file"""
         print("Unzipping file")
@@ -221,13 +376,13 @@ class Predictor(BasePredictor):
             print(filename)
 
     def run_ffmpeg(self, input, output_path: str, command: List[str]):
-        """Run ffmpeg command"""
+        """Run ffmpeg command. Pass output_path=None when command already names every output"""
 
         prepend = ["ffmpeg"]
         if input:
             prepend.extend(["-i", str(input)])
 
-        append = [output_path]
+        append = [output_path] if output_path else []
         command = prepend + command + append
         print("Running ffmpeg command: " + " ".join(command))
         try:
@@ -238,7 +393,7 @@ class Predictor(BasePredictor):
                     e.cmd, e.returncode, e.output
                 )
             )
-        return [Path(output_path)]
+        return [Path(output_path)] if output_path else []
 
     def convert_video_to(self, video_path: Path, type: str = "mp4") -> List[Path]:
         """Convert video to format using ffmpeg"""
@@ -286,9 +441,57 @@ class Predictor(BasePredictor):
 
     def extract_frames_from_input(self, video_path: Path) -> List[Path]:
         """Extract frames from video using ffmpeg"""
-        command = ["-vf", f"fps={self.fps}"] if self.fps != 0 else []
-        self.run_ffmpeg(video_path, "/tmp/outputs/out%03d.png", command)
-
+        if self.scene_aware and self.extract_mode != "all":
+            raise ValueError("scene_aware cannot be combined with extract_mode=" + self.extract_mode)
+        if self.fps != 0 and (self.scene_aware or self.extract_mode != "all"):
+            raise ValueError("fps only applies to extract_mode=all without scene_aware")
+
+        if self.scene_aware:
+            self.extract_frames_at(video_path, [0.0] + self.get_scene_boundaries(video_path))
+        elif self.extract_mode == "seek":
+            if not 1 <= self.num_frames <= MAX_SEEK_FRAMES:
+                raise ValueError(f"num_frames must be between 1 and {MAX_SEEK_FRAMES} for extract_mode=seek")
+            duration = self.get_video_duration(video_path)
+            timestamps = [duration * (i + 0.5) / self.num_frames for i in range(self.num_frames)]
+            self.extract_frames_at(video_path, timestamps)
+        elif self.extract_mode == "keyframes":
+            # Non-key frames are skipped by the decoder, not decoded and dropped
+            command = [
+                "-skip_frame", "nokey",
+                "-i", str(video_path),
+                "-fps_mode", "passthrough",
+            ]
+            self.run_ffmpeg(None, "/tmp/outputs/out%03d.png", command)
+        else:
+            command = ["-vf", f"fps={self.fps}"] if self.fps != 0 else []
+            self.run_ffmpeg(video_path, "/tmp/outputs/out%03d.png", command)
+        return self.zip_frames()
+
+    def extract_frames_at(self, video_path: Path, timestamps: List[float]):
+        """Extract one frame per timestamp using parallel input-side seeks"""
+
+        def extract(i: int, timestamp: float):
+            output_path = f"/tmp/outputs/out{i + 1:03d}.png"
+            # One thread per process, the pool already keeps every core busy
+            command = [
+                "-filter_threads", "1",
+                "-threads", "1",
+                "-ss", str(timestamp),
+                "-i", str(video_path),
+                "-frames:v", "1",
+            ]
+            self.run_ffmpeg(None, output_path, command)
+            # Seeking past the last video frame exits cleanly without writing anything
+            if not os.path.exists(output_path):
+                raise RuntimeError(f"No frame found at {timestamp:.3f}s in {video_path}")
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = [executor.submit(extract, i, t) for i, t in enumerate(timestamps)]
+            for future in futures:
+                future.result()
+
+    def zip_frames(self) -> List[Path]:
+        """Zip extracted out*.png frames"""
         output_files = []
         for filename in os.listdir("/tmp/outputs"):
             if filename.endswith(".png") and filename.startswith("out"):
@@ -396,11 +599,29 @@ class Predictor(BasePredictor):
 
     # NEW TIKTOK TASKS
 
+    def vertical_filter(self) -> str:
+        """Filter chain that fits a frame into 1080x1920"""
+        if self.fit_mode == "blur_pad":
+            # Blur a 108x192 copy and upscale it, a full-size boxblur is far too slow on CPU
+            return (
+                "split=2[bg][fg];"
+                "[bg]scale=108:192:force_original_aspect_ratio=increase,crop=108:192,"
+                "boxblur=4,scale=1080:1920:flags=fast_bilinear[blurred];"
+                "[fg]scale=1080:1920:force_original_aspect_ratio=decrease:force_divisible_by=2[fitted];"
+                "[blurred][fitted]overlay=(W-w)/2:(H-h)/2,setsar=1"
+            )
+        elif self.fit_mode == "color_pad":
+            return (
+                "scale=1080:1920:force_original_aspect_ratio=decrease:force_divisible_by=2,"
+                "pad=1080:1920:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1"
+            )
+        return "scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920"
+
     def make_vertical(self, video_path: Path) -> List[Path]:
         """Convert video to vertical 9:16 aspect ratio for TikTok"""
         command = [
             "-vf",
-            "scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920",
+            self.vertical_filter(),
             "-c:a",
             "copy",
         ]
@@ -477,6 +698,20 @@ class Predictor(BasePredictor):
             "-t", str(self.duration),
             "-c", "copy",
         ]
+        # Only snap when a cut is actually needed, and never to a boundary so early the clip is gutted
+        if self.scene_aware and self.get_video_duration(video_path) > self.duration:
+            boundaries = [
+                t for t in self.get_scene_boundaries(video_path)
+                if self.duration * SCENE_MIN_TRIM_FRACTION <= t <= self.duration
+            ]
+            if boundaries:
+                # Stream copy cuts on packet order, so B-frames of the next shot would leak in
+                command = [
+                    "-t", str(self.get_cut_end(video_path, boundaries[-1])),
+                    "-c:v", "libx264",
+                    "-pix_fmt", "yuv420p",
+                    "-c:a", "copy",
+                ]
         return self.run_ffmpeg(video_path, "/tmp/outputs/trimmed.mp4", command)
 
     def trim_to_audio(self, video_path: Path, audio_path: Path) -> List[Path]:
@@ -511,4 +746,59 @@ class Predictor(BasePredictor):
             "-c:v", "libx264",
             "-c:a", "aac",
         ]
-        return self.run_ffmpeg(video_path, "/tmp/outputs/speed_fitted.mp4", command)
\ No newline at end of file
+        return self.run_ffmpeg(video_path, "/tmp/outputs/speed_fitted.mp4", command)
+
+    def render_bundle(self, video_path: Path) -> List[Path]:
+        """Render several outputs from one decode using a split filter graph"""
+        renditions = []
+        for rendition in self.renditions.split(","):
+            rendition = rendition.strip().lower()
+            if not rendition or rendition in renditions:
+                continue
+            if rendition not in BUNDLE_RENDITIONS:
+                raise ValueError(
+                    "Renditions must be one or more of: " + ", ".join(BUNDLE_RENDITIONS)
+                )
+            renditions.append(rendition)
+
+        if not renditions:
+            raise ValueError("At least one rendition is required for render_bundle task")
+
+        # Decode once, fan the frames out to one branch per rendition
+        graph = [f"[0:v]split={len(renditions)}" + "".join(f"[s{i}]" for i in range(len(renditions)))]
+        outputs = []
+        for i, rendition in enumerate(renditions):
+            if rendition == "mp4":
+                chain = f"fps={self.fps}" if self.fps != 0 else "null"
+                options = [
+                    "-map", "0:a?",
+                    "-c:v", "libx264",
+                    "-pix_fmt", "yuv420p",
+                    "-c:a", "aac",
+                    "-q:a", "0",
+                ]
+                output_path = "/tmp/outputs/video.mp4"
+            elif rendition == "gif":
+                chain = f"fps={self.fps or 12},scale=512:-1:flags=lanczos"
+                options = ["-c:v", "gif"]
+                output_path = "/tmp/outputs/video.gif"
+            elif rendition == "vertical":
+                chain = self.vertical_filter()
+                options = ["-map", "0:a?", "-c:a", "copy"]
+                output_path = "/tmp/outputs/vertical.mp4"
+            else:
+                # Mid-clip frame, the first frame is often black or a fade-in
+                chain = f"trim=start={self.get_video_duration(video_path) / 2}"
+                options = ["-frames:v", "1", "-update", "1"]
+                output_path = "/tmp/outputs/thumbnail.jpg"
+
+            graph.append(f"[s{i}]{chain}[o{i}]")
+            outputs.append((["-map", f"[o{i}]"] + options, output_path))
+
+        # One ffmpeg process writes every output, so the input is decoded only once
+        command = ["-filter_complex", ";".join(graph)]
+        for options, output_path in outputs:
+            command.extend(options + [output_path])
+
+        self.run_ffmpeg(video_path, None, command)
+        return [Path(output_path) for _, output_path in outputs]
@@ -9,6 +9,9 @@ import os
 import sys
 import requests
 import glob
+import mimetypes
+import subprocess
+import tempfile
 import time
 
 def run(output_fn, **kwargs):
@@ -23,10 +26,13 @@ def run(output_fn, **kwargs):
     data = response.json()
     try:
         for i, datauri in enumerate(data["output"]):
-            base64_encoded_data = datauri.split(",")[1]
+            header, base64_encoded_data = datauri.split(",", 1)
             decoded_data = base64.b64decode(base64_encoded_data)
+            # Keep each output's own extension, e.g. render_bundle returns mp4, gif and jpg
+            mime_type = header[len("data:"):].split(";")[0]
+            extension = mimetypes.guess_extension(mime_type) or f".{output_fn.rsplit('.', 1)[1]}"
             with open(
-                f"{output_fn.rsplit('.', 1)[0]}_{i}.{output_fn.rsplit('.', 1)[1]}", "wb"
+                f"{output_fn.rsplit('.', 1)[0]}_{i}{extension}", "wb"
             ) as f:
                 f.write(decoded_data)
         print("Wrote", output_fn)
@@ -36,6 +42,96 @@ def run(output_fn, **kwargs):
         print(data["logs"])
         sys.exit(1)
 
+def timed_prediction(**kwargs):
+    start = time.time()
+    response = requests.post("http://localhost:5000/predictions", json={"input": kwargs})
+    elapsed = time.time() - start
+    if response.json().get("status") != "succeeded":
+        print("Error!", kwargs)
+        print(response.json().get("logs"))
+        sys.exit(1)
+    return elapsed
+
+def benchmark_input(path_or_url):
+    """Local files are sent inline, so only URLs add download time to each prediction"""
+    if not os.path.exists(path_or_url):
+        return path_or_url
+    mime_type = mimetypes.guess_type(path_or_url)[0] or "application/octet-stream"
+    with open(path_or_url, "rb") as f:
+        return f"data:{mime_type};base64," + base64.b64encode(f.read()).decode()
+
+def benchmark_render_bundle(input_file):
+    """Compare one render_bundle prediction against the equivalent separate predictions"""
+    separate = 0.0
+    separate += timed_prediction(task="convert_input_to_mp4", input_file=input_file)
+    separate += timed_prediction(task="convert_input_to_gif", input_file=input_file)
+    separate += timed_prediction(task="make_vertical", input_file=input_file)
+    separate += timed_prediction(
+        task="extract_frames_from_input",
+        input_file=input_file,
+        extract_mode="seek",
+        num_frames=1,
+    )
+    bundled = timed_prediction(
+        task="render_bundle",
+        input_file=input_file,
+        renditions="mp4,gif,vertical,thumbnail",
+    )
+    print(f"Separate predictions: {separate:.2f}s")
+    print(f"render_bundle: {bundled:.2f}s ({separate / bundled:.2f}x faster)")
+
+def benchmark_fit_modes(input_file):
+    """Time make_vertical with each fit_mode"""
+    for fit_mode in ["crop", "blur_pad", "color_pad"]:
+        elapsed = timed_prediction(task="make_vertical", input_file=input_file, fit_mode=fit_mode)
+        print(f"make_vertical fit_mode={fit_mode}: {elapsed:.2f}s")
+
+def check_scene_trim():
+    """Check a scene-aware trim stops on the last frame before a cut that is off the proxy grid"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clip = f"{tmp_dir}/offgrid.mp4"
+        # Gray until 4.1s, white until 7.3s, then blue; neither cut lands on a 0.2s proxy frame
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error",
+                "-f", "lavfi", "-i", "color=gray:s=640x360:r=30:d=4.1",
+                "-f", "lavfi", "-i", "color=white:s=640x360:r=30:d=3.2",
+                "-f", "lavfi", "-i", "color=blue:s=640x360:r=30:d=2.7",
+                "-filter_complex", "[0:v][1:v][2:v]concat=n=3:v=1:a=0,format=yuv420p",
+                "-c:v", "libx264",
+                clip,
+            ],
+            check=True,
+        )
+        with open(clip, "rb") as f:
+            input_file = "data:video/mp4;base64," + base64.b64encode(f.read()).decode()
+
+        response = requests.post(
+            "http://localhost:5000/predictions",
+            json={"input": {"task": "trim_to_length", "input_file": input_file, "duration": 9, "scene_aware": True}},
+        )
+        trimmed = f"{tmp_dir}/trimmed.mp4"
+        with open(trimmed, "wb") as f:
+            f.write(base64.b64decode(response.json()["output"][0].split(",", 1)[1]))
+        frames = subprocess.run(
+            [
+                "ffprobe", "-v", "quiet",
+                "-select_streams", "v:0",
+                "-count_frames",
+                "-show_entries", "stream=nb_read_frames",
+                "-of", "csv=p=0",
+                trimmed,
+            ],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+
+    # 7.3s at 30fps
+    if frames != "219":
+        print(f"Scene trim check failed: expected 219 frames, got {frames}")
+        sys.exit(1)
+    print("Scene trim check passed")
+
 def main():
     # Original tasks
     run(
@@ -114,6 +210,21 @@ def main():
         input_file="https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4",
     )
 
+    run(
+        "sample_extract_keyframes.zip",
+        task="extract_frames_from_input",
+        extract_mode="keyframes",
+        input_file="https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4",
+    )
+    
+    run(
+        "sample_extract_seek_frames.zip",
+        task="extract_frames_from_input",
+        extract_mode="seek",
+        num_frames=8,
+        input_file="https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4",
+    )
+
     # NEW TIKTOK TASKS
     
     # Make vertical (TikTok format)
@@ -123,6 +234,14 @@ def main():
         input_file="https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4",
     )
     
+    # Make vertical with the full frame over a blurred background
+    run(
+        "sample_blur_pad_vertical.mp4",
+        task="make_vertical",
+        input_file="https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4",
+        fit_mode="blur_pad",
+    )
+    
     # Add background music
     run(
         "sample_with_background_music.mp4",
@@ -174,6 +293,23 @@ def main():
         duration=30,
     )
     
+    # Trim to the last shot boundary before 15 seconds
+    run(
+        "sample_trim_to_scene.mp4",
+        task="trim_to_length",
+        input_file="https://replicate.delivery/pbxt/CmppJesjwO3jPSmdd1fflCjGeODlOpVy5I0PyXlgLeMmanVRC/video.mp4",
+        duration=15,
+        scene_aware=True,
+    )
+    
+    # One frame per shot
+    run(
+        "sample_extract_scene_frames.zip",
+        task="extract_frames_from_input",
+        input_file="https://replicate.delivery/pbxt/CmppJesjwO3jPSmdd1fflCjGeODlOpVy5I0PyXlgLeMmanVRC/video.mp4",
+        scene_aware=True,
+    )
+    
     # Trim video to match audio length
     run(
         "sample_trim_to_audio.mp4",
@@ -190,6 +326,14 @@ def main():
         audio_file="https://www.soundjay.com/misc/sounds/bell-ringing-05.wav",  # Replace with actual audio URL
     )
     
+    # Render mp4, gif, vertical and thumbnail from a single decode
+    run(
+        "sample_render_bundle.mp4",
+        task="render_bundle",
+        input_file="https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4",
+        renditions="mp4,gif,vertical,thumbnail",
+    )
+    
     # Combined workflow examples
     
     # Complete TikTok workflow: horizontal video    # Complete TikTok workflow: horizontal video → vertical + music + trim
@@ -210,4 +354,17 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        # python samples.py --benchmark [local file or URL]
+        arguments = sys.argv[sys.argv.index("--benchmark") + 1:]
+        input_file = benchmark_input(
+            arguments[0] if arguments
+            else "https://replicate.delivery/pbxt/0hNQY7Gy2eSiG6ghDRkabuJeV4oDNETFB6cWi2NdfB2TdMvhA/out.mp4"
+        )
+        print(f"Local CPUs: {os.cpu_count()}")
+        benchmark_render_bundle(input_file)
+        benchmark_fit_modes(input_file)
+    elif "--check-scene-trim" in sys.argv:
+        check_scene_trim()
+    else:
+        main()